@@ -0,0 +1,104 @@
+#Headless type checker, reports the same errors shown in the editor
+#for any number of root files. Run from the Packages directory:
+#
+#   python -m subtype.check [--jobs N] [--shards N] root.ts [root.ts ...]
+#
+#Prints a JSON report and exits with 1 if there are errors, or 2 if
+#any root couldn't be checked.
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from .tss import TSSInterface, libs_dir
+from .util import norm_path
+
+def check_root(root_path, shards=1):
+    result = {'root': root_path}
+    start_timer = time.monotonic()
+
+    interface = TSSInterface(shards=shards)
+
+    try:
+        interface._connect(root_path)
+        load_timer = time.monotonic()
+
+        errors = interface.get_errors()
+        check_timer = time.monotonic()
+
+        if errors is None:
+            raise Exception('tss is not responding')
+
+        result['files'] = interface.files
+        result['errors'] = errors
+        result['load_time'] = load_timer - start_timer
+        result['check_time'] = check_timer - load_timer
+        result.update(interface.get_metrics())
+
+    except Exception as e:
+        result['failure'] = str(e)
+
+    finally:
+        interface._close()
+
+    result['time'] = time.monotonic() - start_timer
+    return result
+
+
+def check(root_paths, jobs=None, shards=1):
+    #Every root is a tss process, jobs bounds how many run at once.
+    jobs = jobs or multiprocessing.cpu_count()
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(lambda root_path: check_root(root_path, shards), root_paths))
+
+    #Files shared by many roots are reported once, with the errors
+    #from the first root (in the given order) that has them.
+    errors = []
+    checked_files = set()
+
+    for result in results:
+        files = set([f for f in result.pop('files', []) if not f.startswith(libs_dir + '/')])
+        files -= checked_files
+        root_errors = result.pop('errors', [])
+
+        errors.extend([e for e in root_errors if norm_path(e['file']) in files])
+        checked_files.update(files)
+
+    return {
+        'roots': results,
+        'files': len(checked_files),
+        'errors': errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='subtype.check', description='Type checks TypeScript root files.')
+    parser.add_argument('roots', nargs='+', help='root files to check')
+    parser.add_argument('--jobs', type=int, default=None, help='roots checked at once, the number of cores by default')
+    parser.add_argument('--shards', type=int, default=1, help='processes the check of every root is split in')
+    args = parser.parse_args()
+
+    #The interfaces log every request, which would be mixed with the
+    #report otherwise.
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+
+    try:
+        report = check([norm_path(root) for root in args.roots], args.jobs, max(1, args.shards))
+    finally:
+        sys.stdout = stdout
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+    if any(['failure' in root for root in report['roots']]):
+        sys.exit(2)
+
+    sys.exit(1 if report['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
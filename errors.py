@@ -2,6 +2,8 @@ from os import path
 import sublime
 import sublime_plugin
 
+from .util import norm_path
+
 base_dir = path.dirname(path.abspath(__file__))
 icons_dir = path.join('..', path.basename(base_dir), 'icons')
 illegal_icon = path.join(icons_dir, 'simple-illegal')
@@ -28,6 +30,12 @@ class ErrorManager():
         illegals = []
         warnings = []
 
+        #Files with thousands of errors (usually generated ones) only
+        #get the first ones drawn.
+        policy = self.interface_manager.file_policies.get(norm_path(view.file_name()), view.size())
+        if policy.get('max_regions') is not None:
+            errors = errors[:policy['max_regions']]
+
         for e in errors:
             if not e.get('region'):
                 start = view.text_point(*e['start'])
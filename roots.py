@@ -0,0 +1,144 @@
+import os
+import re
+import time
+import threading
+from os import path
+
+from .util import norm_path
+
+reference_pattern = re.compile(r'^\s*///\s*<reference\s+path\s*=\s*[\'"]([^\'"]+)[\'"]', re.M)
+import_pattern = re.compile(r'^\s*(?:export\s+)?import\s+[\w$]+\s*=\s*require\s*\(\s*[\'"]([^\'"]+)[\'"]\s*\)', re.M)
+
+class RootIndex():
+
+    def __init__(self, max_files=5000, max_age=60):
+        #References and imports of every scanned file, along with the
+        #mtime they were scanned at so changed files are scanned again.
+        self.references_by_path = {}
+
+        #TypeScript files under every scanned folder and when they were
+        #listed, folders are listed again when older than max_age.
+        self.files_by_folder = {}
+
+        self.max_files = max_files
+        self.max_age = max_age
+
+        self._lock = threading.RLock()
+
+
+    def get_references(self, file_path):
+        try:
+            mtime = path.getmtime(file_path)
+        except OSError:
+            return set()
+
+        with self._lock:
+            cached = self.references_by_path.get(file_path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        try:
+            with open(file_path, encoding='utf-8') as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            content = ''
+
+        dir_name = path.dirname(file_path)
+        references = set()
+
+        for reference in reference_pattern.findall(content):
+            references.add(norm_path(path.join(dir_name, reference)))
+
+        for module in import_pattern.findall(content):
+            if not module.startswith('.'):
+                continue
+
+            for extension in ('.ts', '.d.ts'):
+                module_path = norm_path(path.join(dir_name, module + extension))
+                if path.exists(module_path):
+                    references.add(module_path)
+                    break
+
+        with self._lock:
+            self.references_by_path[file_path] = (mtime, references)
+
+        return references
+
+
+    def get_files(self, folder):
+        with self._lock:
+            cached = self.files_by_folder.get(folder)
+            if cached and time.monotonic() - cached[0] < self.max_age:
+                return cached[1]
+
+        files = []
+        for dir_name, dir_names, file_names in os.walk(folder):
+            dir_names[:] = [d for d in dir_names if not d.startswith('.') and d != 'node_modules']
+
+            for file_name in file_names:
+                if file_name.endswith('.ts'):
+                    files.append(norm_path(path.join(dir_name, file_name)))
+
+            if len(files) >= self.max_files:
+                break
+
+        with self._lock:
+            self.files_by_folder[folder] = (time.monotonic(), files)
+
+        return files
+
+
+    def invalidate(self, file_path):
+        #Lists again the folders the file is in, in case it is new.
+        with self._lock:
+            self.references_by_path.pop(file_path, None)
+
+            for folder in list(self.files_by_folder.keys()):
+                if file_path.startswith(folder + '/'):
+                    del self.files_by_folder[folder]
+
+
+    def get_reachable(self, file_path):
+        reachable = set([file_path])
+        pending = [file_path]
+
+        while pending:
+            for reference in self.get_references(pending.pop()):
+                if reference not in reachable:
+                    reachable.add(reference)
+                    pending.append(reference)
+
+        return reachable
+
+
+    def get_root(self, file_path, folders):
+        #The root of a file is the file, not referenced by any other one,
+        #that reaches it and the most files through its references. The
+        #file itself if nothing references it.
+        folders = [norm_path(f) for f in folders]
+        folders = [f for f in folders if file_path.startswith(f + '/')]
+        folders.append(path.dirname(file_path))
+
+        referrers_by_path = {}
+        for folder in set(folders):
+            for f in self.get_files(folder):
+                for reference in self.get_references(f):
+                    if reference not in referrers_by_path:
+                        referrers_by_path[reference] = set()
+
+                    referrers_by_path[reference].add(f)
+
+        referrers = set([file_path])
+        pending = [file_path]
+
+        while pending:
+            for referrer in referrers_by_path.get(pending.pop(), []):
+                if referrer not in referrers:
+                    referrers.add(referrer)
+                    pending.append(referrer)
+
+        roots = [f for f in referrers if not referrers_by_path.get(f)]
+        if not roots:
+            return file_path
+
+        return max(roots, key=lambda root: (len(self.get_reachable(root)), root == file_path, root))
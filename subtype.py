@@ -1,16 +1,72 @@
 import sublime_plugin
 import sublime
+import html
+import re
+import time
+import threading
 
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 from .tss import InterfaceManager, InterfaceCollection
 from .errors import ErrorManager
+from .symbols import SymbolIndex
 from .watcher import ModuleWatcher
+from .roots import RootIndex
 from . import util
 
 interface_manager = InterfaceManager()
 error_manager = ErrorManager(interface_manager)
+symbol_index = SymbolIndex(interface_manager)
 module_watcher = ModuleWatcher()
+root_index = RootIndex()
+
+interface_manager.root_index = root_index
+
+#Interfaces are created by a few threads, so opening files of a
+#project doesn't wait for the tss of unrelated projects to load.
+interface_pool = ThreadPoolExecutor(max_workers=4)
+
+#Adds waiting for the pool by view id, and the views closed while
+#their add was already running, removed as soon as it's done.
+pending_adds = {}
+closed_views = set()
+pending_lock = threading.Lock()
+
+def add_view(view):
+    def add():
+        try:
+            interface_manager.add(view)
+        except Exception as e:
+            print('Failed adding {0}: {1}'.format(view.file_name(), e))
+        finally:
+            with pending_lock:
+                del pending_adds[view.id()]
+                closed = view.id() in closed_views
+                closed_views.discard(view.id())
+
+        if closed and interface_manager.get_file(view):
+            interface_manager.remove(view)
+
+    #Held while submitting so the add can't finish before it's tracked.
+    with pending_lock:
+        if view.id() not in pending_adds:
+            pending_adds[view.id()] = interface_pool.submit(add)
+
+
+def remove_view(view):
+    with pending_lock:
+        future = pending_adds.get(view.id())
+        if future:
+            if not future.cancel():
+                closed_views.add(view.id())
+                return
+
+            del pending_adds[view.id()]
+
+    if interface_manager.get_file(view):
+        interface_manager.remove(view)
+
 
 def update_errors(view=None, tss=None):
     #Getting the interface before actually running the code,
@@ -20,9 +76,18 @@ def update_errors(view=None, tss=None):
     if not tss:
         tss = interface_manager.get(view)
 
+    #The view may still be waiting for its interface to be created.
+    if not tss:
+        return
+
     def get_errors():
         results = tss.get_errors()
         for interface, errors in results:
+            #The interface is unavailable while restarting, the
+            #last known errors are kept until it is back.
+            if errors is None:
+                continue
+
             #Error code TS2071 may happen in three cases:
             # -When the imported file is not there, in this case the module_watcher
             #  will trigger when the file is created, and it will reload the tss.
@@ -38,14 +103,41 @@ def update_errors(view=None, tss=None):
 
             error_manager.parse(errors, interface)
 
+            #Only the files whose version changed are indexed again.
+            symbol_index.update_interface(interface)
+            util.debounce(symbol_index.save, 30, 'save_symbols')
+
     #The views are updated separatelly from the errors so it is
     #guaranteed that every view of the project will be updated
     #before the error getter kicks in.
     if view:
-        util.debounce(tss.update, 1, 'update' + str(view.id()), view)
+        views_to_update[view.id()] = view
+        util.debounce(update_views, 1, 'update')
     util.debounce(get_errors, 1.5, 'get_errors' + str(hash(tss)))
 
 
+views_to_update = {}
+def update_views():
+    #Every view modified since the last run is sent in a single batch
+    #per interface, so edits across many files (e.g. a find and replace)
+    #don't take one round trip each.
+    views_by_interface = {}
+    while views_to_update:
+        view = views_to_update.popitem()[1]
+        tss = interface_manager.get(view)
+        if not tss:
+            continue
+
+        for interface in tss.interfaces:
+            if interface not in views_by_interface:
+                views_by_interface[interface] = []
+
+            views_by_interface[interface].append(view)
+
+    for interface, views in views_by_interface.items():
+        interface.update_views(views)
+
+
 def update_status_message(view):
     errors = error_manager.get(view, view.sel()[0].a)
     msg = '; '.join([e['text'] for e in errors])
@@ -56,18 +148,107 @@ def update_status_message(view):
     sublime.status_message(msg)
 
 
+#Type info by (file, buffer version, identifier span), the same
+#identifier is asked for many times while the cursor moves around.
+quick_info_cache = util.LRUCache(512)
+identifier_pattern = re.compile(r'^[a-zA-Z_$][0-9a-zA-Z_$]*$')
+
+def get_quick_info_key(view, point):
+    word = view.word(point)
+    if not identifier_pattern.match(view.substr(word)):
+        return None
+
+    return (view.file_name(), util.get_view_version(view), word.a, word.b)
+
+
+def get_quick_info(view, point):
+    key = get_quick_info_key(view, point)
+    if not key:
+        return {}
+
+    info = quick_info_cache.get(key)
+    if info is not None:
+        return info
+
+    tss = interface_manager.get(view)
+    if not tss:
+        return {}
+
+    #The type is asked for the start of the identifier, so every
+    #position inside of it gives the same result. The view is left
+    #in views_to_update, so every other interface gets the edit too.
+    tss[0].update(view)
+    info = tss[0].get_type(view, view.rowcol(key[2]))
+
+    #Not cached while the interface is unavailable.
+    if info is not None:
+        quick_info_cache.set(key, info)
+
+    return info or {}
+
+
+def format_quick_info(info):
+    if not info:
+        return ''
+
+    return '({0}) {1}: {2}'.format(info['kind'], info['symbol'], info['type'])
+
+
+def update_quick_info(view):
+    info = get_quick_info(view, view.sel()[0].b)
+    view.set_status('typescript_type', format_quick_info(info))
+
+
+def request_quick_info(view):
+    #Cached results are shown right away, everything else is coalesced
+    #so only the position the cursor stops at is asked to the tss.
+    key = get_quick_info_key(view, view.sel()[0].b)
+    info = quick_info_cache.get(key) if key else {}
+
+    if info is not None:
+        util.remove_debounce('quick_info')
+        view.set_status('typescript_type', format_quick_info(info))
+    else:
+        util.debounce(update_quick_info, 0.3, 'quick_info', view)
+
+
+def show_quick_info_popup(view, point):
+    info = get_quick_info(view, point)
+    if not info:
+        return
+
+    content = '<code>{0}</code>'.format(html.escape(format_quick_info(info)))
+    if info['doc']:
+        content += '<br>{0}'.format(html.escape(info['doc']))
+
+    view.show_popup(content, sublime.HIDE_ON_MOUSE_MOVE_AWAY, point, 600)
+
+
 completions_by_view = {}
 def update_completions(view):
-    tss = interface_manager.get(view)[0]
+    tss = interface_manager.get(view)
+    if not tss:
+        completions_by_view.pop(view.id(), None)
+        return
+
+    tss = tss[0]
     #The cursor rowcol is saved before the update because
     #the user may change it while the update is running,
     #in which case the completion may throw an error.
     pos = util.get_cursor_rowcol(view)
 
-    util.remove_debounce('update' + str(view.id()))
+    #Skipped by the interface if the buffer didn't change since the last
+    #update, which is the case for most completions. The view is left in
+    #views_to_update so the other interfaces of the file get it as well.
     tss.update(view)
 
     completions = tss.get_completions(view, pos)
+
+    #Asked for again next time while the interface is unavailable.
+    if completions is None:
+        completions_by_view.pop(view.id(), None)
+        return
+
     completions_by_view[view.id()] = completions
 
     if completions:
@@ -79,15 +260,22 @@ def update_completions(view):
 
 def get_completions(view):
     completions = completions_by_view.get(view.id())
+    prefetched = get_prefetched_completions(view)
+
+    if completions is None and prefetched is not None:
+        completions = format_completions(prefetched)
+
+    elif completions is None:
+        #A pending prefetch shows its completions once it is done.
+        if view.id() not in prefetching_views:
+            sublime.set_timeout_async(lambda: update_completions(view), 0)
 
-    if completions is None:
-        sublime.set_timeout_async(lambda: update_completions(view), 0)
         completions_by_view[view.id()] = 'Loading'
         completions = []
 
     elif type(completions) is list:
         completions = completions_by_view[view.id()]
-        completions = [[c['name'] + '\t' + (c['type'] or ''), c['name']] for c in completions]
+        completions = format_completions(completions)
 
         del completions_by_view[view.id()]
 
@@ -97,6 +285,96 @@ def get_completions(view):
     return (completions, sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS)
 
 
+def format_completions(completions):
+    return [[c['name'] + '\t' + (c['type'] or ''), c['name']] for c in completions]
+
+
+#Member completions requested as soon as the cursor is after a '.',
+#by view, along with the buffer version and point of the request.
+prefetched_completions = {}
+prefetching_views = set()
+member_pattern = re.compile(r'^[0-9a-zA-Z_$]*$')
+
+def prefetch_completions(view):
+    #Called from the main thread, the view is marked as soon as the
+    #prefetch is queued so completions asked for before it runs wait
+    #for it instead of being requested again.
+    point = view.sel()[0].b
+    if point == 0 or view.substr(point - 1) != '.':
+        return
+
+    prefetched = prefetched_completions.get(view.id())
+    if prefetched and prefetched[:2] == (util.get_view_version(view), point):
+        return
+
+    if view.id() in prefetching_views or not interface_manager.get_file(view):
+        return
+
+    prefetching_views.add(view.id())
+    sublime.set_timeout_async(lambda: run_prefetch_completions(view, point), 0)
+
+
+def run_prefetch_completions(view, point):
+    try:
+        tss = interface_manager.get(view)
+        if not tss:
+            completions = None
+        else:
+            #The same as in update_completions, the view is left in
+            #views_to_update for the other interfaces of the file. Full
+            #entries are asked for, as they're shown for every member
+            #name typed after the '.'.
+            version = util.get_view_version(view)
+            tss[0].update(view)
+            completions = tss[0].get_completions(view, view.rowcol(point), member=True)
+    finally:
+        prefetching_views.discard(view.id())
+
+    #Nothing is prefetched while the interface is unavailable, a popup
+    #asked for in the meantime is requested again next time.
+    if completions is None:
+        if completions_by_view.get(view.id()) == 'Loading':
+            del completions_by_view[view.id()]
+
+        return
+
+    prefetched_completions[view.id()] = (version, point, completions)
+
+    #The popup was asked for while the prefetch was pending.
+    if completions_by_view.get(view.id()) == 'Loading':
+        completions_by_view[view.id()] = completions
+
+        if completions:
+            view.run_command('auto_complete', {
+                'disable_auto_insert' : True,
+                'next_completion_if_showing' : True
+            })
+
+
+def get_prefetched_completions(view):
+    prefetched = prefetched_completions.get(view.id())
+    if not prefetched:
+        return None
+
+    (buffer_id, change_count), point, completions = prefetched
+    cursor = view.sel()[0].b
+
+    if buffer_id != view.buffer_id() or cursor < point:
+        return None
+
+    #Still valid while the only changes since the request are the
+    #characters of the member name typed after the '.'.
+    typed = view.substr(sublime.Region(point, cursor))
+    if view.change_count() != change_count + len(typed) or not member_pattern.match(typed):
+        return None
+
+    return completions
+
+
+def open_location(window, path, row, col):
+    window.open_file('{0}:{1}:{2}'.format(path, row + 1, col + 1), sublime.ENCODED_POSITION)
+
+
 has_reference_changes = []
 def update_reference_changes(view):
     f = interface_manager.get_file(view)
@@ -140,6 +418,7 @@ def on_view_removed(view, f):
         has_reference_changes.remove(f)
 
     error_manager.clear_view(view)
+    prefetched_completions.pop(view.id(), None)
 
 
 #This one is defined just for the sake of completion.
@@ -163,7 +442,60 @@ def on_module_change(tss):
     #Wrap the interface in a collection so everything works properly.
     tss = InterfaceCollection([tss])
     interface_manager.reload(tss)
-    update_errors(tss=tss)
+
+    #An idle project is not woken by the watcher, its errors are
+    #updated once it is used again.
+    if not tss[0].hibernated:
+        update_errors(tss=tss)
+
+
+def load_settings():
+    settings = sublime.load_settings('subtype.sublime-settings')
+
+    interface_manager.hibernate_after = settings.get('hibernate_after', 1800) or None
+    memory_budget = settings.get('memory_budget', 2048)
+    interface_manager.memory_budget = memory_budget * 1024 * 1024 if memory_budget else None
+    interface_manager.background_worker = settings.get('background_worker', False)
+    interface_manager.check_shards = max(1, settings.get('check_processes', 1))
+    interface_manager.file_policies.policies = settings.get('file_policies', [])
+
+
+def hibernate_interfaces():
+    interface_manager.hibernate_idle()
+    sublime.set_timeout_async(hibernate_interfaces, 60000)
+
+
+#The type checker of every process is warmed up while the user is
+#idle, checking a file at a time so any request can get in between.
+warm_up_delay = 2
+warm_up_stop = threading.Event()
+last_activity = time.monotonic()
+
+def mark_activity():
+    global last_activity
+    last_activity = time.monotonic()
+
+
+def warm_up_interfaces():
+    while not warm_up_stop.is_set():
+        idle = time.monotonic() - last_activity
+        if idle < warm_up_delay:
+            warm_up_stop.wait(warm_up_delay - idle)
+            continue
+
+        #The most recently used projects and their open files first,
+        #copied under the lock since views are added from other threads.
+        with interface_manager._lock:
+            active_paths = [(interface, list(paths)) for interface, paths
+                            in interface_manager.active_paths_by_interface.items()]
+
+        active_paths.sort(key=lambda item: -item[0].last_used)
+
+        for interface, paths in active_paths:
+            if interface.warm_up(paths):
+                break
+        else:
+            warm_up_stop.wait(1)
 
 
 interface_manager.on_view_added   = on_view_added
@@ -172,14 +504,20 @@ interface_manager.on_file_added   = on_file_added
 interface_manager.on_file_removed = on_file_removed
 interface_manager.on_file_rename  = on_file_rename
 
+def on_files_created(paths):
+    for path in paths:
+        root_index.invalidate(util.norm_path(path))
+
+
 module_watcher.on_module_change   = on_module_change
+module_watcher.on_files_created   = on_files_created
 
 
 class SubtypeListener(sublime_plugin.EventListener):
 
     @util.typescript_view
     def on_load_async(self, view):
-        interface_manager.add(view)
+        add_view(view)
 
     def on_clone_async(self,view):
         self.on_load_async(view)
@@ -187,12 +525,19 @@ class SubtypeListener(sublime_plugin.EventListener):
 
     @util.typescript_view
     def on_modified_async(self, view):
+        mark_activity()
         update_reference_changes(view)
         update_errors(view)
 
 
+    @util.typescript_view
+    def on_modified(self, view):
+        prefetch_completions(view)
+
+
     @util.typescript_view
     def on_post_save_async(self, view):
+        root_index.invalidate(util.norm_path(view.file_name()))
         handle_reference_changes(view)
         update_errors(view)
         error_manager.list_errors()
@@ -200,39 +545,129 @@ class SubtypeListener(sublime_plugin.EventListener):
 
     @util.typescript_view
     def on_close(self, view):
-        interface_manager.remove(view)
+        remove_view(view)
 
 
     @util.typescript_view
     def on_selection_modified_async(self, view):
+        mark_activity()
         update_status_message(view)
+        request_quick_info(view)
+
+
+    @util.typescript_view
+    def on_selection_modified(self, view):
+        prefetch_completions(view)
+
+
+    @util.typescript_view
+    def on_hover(self, view, point, hover_zone):
+        if hover_zone == sublime.HOVER_TEXT:
+            sublime.set_timeout_async(partial(show_quick_info_popup, view, point), 0)
 
 
     @util.typescript_view
     def on_query_completions(self, view, prefix, locations):
+        mark_activity()
         return get_completions(view)
 
 
     def on_text_command(self, view, cmd, args):
         def on_file_type_change():
             if util.is_typescript(view) and not interface_manager.get(view):
-                interface_manager.add(view)
+                add_view(view)
 
-            elif not util.is_typescript(view) and interface_manager.get(view):
-                interface_manager.remove(view)
+            elif not util.is_typescript(view):
+                remove_view(view)
 
         if cmd == 'set_file_type':
             sublime.set_timeout_async(on_file_type_change, 0)
 
 
 
+class SubtypeGotoSymbolCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        symbols = symbol_index.get_symbols()
+        if not symbols:
+            sublime.status_message('No TypeScript symbols indexed yet')
+            return
+
+        items = []
+        for symbol in symbols:
+            name = symbol['name']
+            if symbol['container']:
+                name = symbol['container'] + '.' + name
+
+            items.append([name, '{0} {1}:{2}'.format(symbol['kind'], symbol['path'], symbol['row'] + 1)])
+
+        def on_done(index):
+            if index != -1:
+                s = symbols[index]
+                open_location(self.window, s['path'], s['row'], s['col'])
+
+        self.window.show_quick_panel(items, on_done)
+
+
+class SubtypeFindReferencesCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit):
+        name = self.view.substr(self.view.word(self.view.sel()[0]))
+        references = symbol_index.get_references(name)
+        if not references:
+            sublime.status_message('No references to {0} indexed'.format(name))
+            return
+
+        lines_by_path = {}
+        items = []
+        for r in references:
+            if r['path'] not in lines_by_path:
+                lines_by_path[r['path']] = symbol_index.get_content(r['path']).split('\n')
+
+            lines = lines_by_path[r['path']]
+            line = lines[r['row']].strip() if r['row'] < len(lines) else ''
+            items.append(['{0}:{1}'.format(r['path'], r['row'] + 1), line])
+
+        def on_done(index):
+            if index != -1:
+                r = references[index]
+                open_location(self.view.window(), r['path'], r['row'], r['col'])
+
+        self.view.window().show_quick_panel(items, on_done)
+
+
+    def is_enabled(self):
+        return bool(util.is_typescript(self.view))
+
+
+
 def plugin_loaded():
-    for window in sublime.windows():
-        for view in window.views():
-            if util.is_typescript(view):
-                sublime.set_timeout_async(partial(interface_manager.add, view), 0)
+    settings = sublime.load_settings('subtype.sublime-settings')
+    settings.add_on_change('subtype', load_settings)
+    load_settings()
+
+    sublime.set_timeout_async(hibernate_interfaces, 60000)
+    sublime.set_timeout_async(symbol_index.load, 0)
+
+    warm_up_thread = threading.Thread(target=warm_up_interfaces)
+    warm_up_thread.daemon = True
+    warm_up_thread.start()
+
+    #The projects of the active views are started first, the pool
+    #takes the views in the order they are added.
+    active_view_ids = [w.active_view().id() for w in sublime.windows() if w.active_view()]
+
+    views = [view for window in sublime.windows() for view in window.views()]
+    views.sort(key=lambda view: view.id() not in active_view_ids)
+
+    for view in views:
+        if util.is_typescript(view):
+            add_view(view)
 
 
 def plugin_unloaded():
+    warm_up_stop.set()
+    interface_pool.shutdown(wait=False)
+    symbol_index.save()
     interface_manager.close_all()
     module_watcher.close_all()
@@ -0,0 +1,154 @@
+from os import path
+import os
+import re
+import json
+import threading
+import sublime
+
+from .tss import libs_dir
+from .util import get_view_version
+
+identifier_pattern = re.compile(r'[a-zA-Z_$][0-9a-zA-Z_$]*')
+
+class SymbolIndex():
+
+    def __init__(self, interface_manager):
+        self.interface_manager = interface_manager
+
+        #Every indexed file has the version it was indexed at, its
+        #declarations, from the tss structure, and the positions of
+        #every identifier in it, used for a first cut of references.
+        self.files_by_path = {}
+
+        self._lock = threading.Lock()
+
+
+    def get_version(self, path):
+        #Unsaved buffers are versioned by the view, everything else
+        #by the file in disk, which stays valid between sessions.
+        for view in self.interface_manager.get_views(path):
+            if view.is_dirty():
+                return list(get_view_version(view))
+
+        return self.get_disk_version(path)
+
+
+    def get_disk_version(self, path):
+        try:
+            return ['disk', os.path.getmtime(path)]
+        except OSError:
+            return None
+
+
+    def get_content(self, path):
+        for view in self.interface_manager.get_views(path):
+            return view.substr(sublime.Region(0, view.size()))
+
+        try:
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return ''
+
+
+    def update_interface(self, interface):
+        versions = {}
+        for path in interface.files or []:
+            if path.startswith(libs_dir):
+                continue
+
+            version = self.get_version(path)
+            indexed = self.files_by_path.get(path)
+
+            if not indexed or indexed['version'] != version:
+                versions[path] = version
+
+        if not versions:
+            return
+
+        structure = interface.get_structure(list(versions.keys()))
+        if structure is None:
+            return
+
+        with self._lock:
+            for path, symbols in structure.items():
+                self.files_by_path[path] = {
+                    'version': versions[path],
+                    'symbols': symbols,
+                    'identifiers': self.get_identifiers(self.get_content(path))
+                }
+
+
+    def get_identifiers(self, content):
+        identifiers = {}
+        for row, line in enumerate(content.split('\n')):
+            for match in identifier_pattern.finditer(line):
+                name = match.group(0)
+                if name not in identifiers:
+                    identifiers[name] = []
+
+                identifiers[name].append((row, match.start()))
+
+        return identifiers
+
+
+    def get_indexed_files(self):
+        #Files from closed projects stay in the index, so it is still
+        #valid when they are opened again, but are left out of queries.
+        with self._lock:
+            return [(p, i) for p, i in self.files_by_path.items()
+                    if p in self.interface_manager.file_by_path]
+
+
+    def get_symbols(self):
+        symbols = []
+        for path, indexed in self.get_indexed_files():
+            for symbol in indexed['symbols']:
+                symbols.append(dict(symbol, path=path))
+
+        symbols.sort(key=lambda s: (s['name'].lower(), s['path'], s['row']))
+        return symbols
+
+
+    def get_references(self, name):
+        references = []
+        for path, indexed in self.get_indexed_files():
+            for row, col in indexed['identifiers'].get(name, []):
+                references.append({'path': path, 'row': row, 'col': col})
+
+        references.sort(key=lambda r: (r['path'], r['row'], r['col']))
+        return references
+
+
+    def get_cache_file(self):
+        return path.join(sublime.cache_path(), 'subtype', 'symbols.json')
+
+
+    def load(self):
+        try:
+            with open(self.get_cache_file(), encoding='utf-8') as f:
+                files_by_path = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        #Only the versions from disk mean anything in a new session, and
+        #files changed or deleted since then are dropped.
+        with self._lock:
+            for path, indexed in files_by_path.items():
+                if indexed['version'] == self.get_disk_version(path):
+                    self.files_by_path.setdefault(path, indexed)
+
+
+    def save(self):
+        with self._lock:
+            files_by_path = dict([(p, i) for p, i in self.files_by_path.items()
+                                  if i['version'] and i['version'][0] == 'disk'])
+
+        cache_file = self.get_cache_file()
+
+        try:
+            os.makedirs(path.dirname(cache_file), exist_ok=True)
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(files_by_path, f)
+        except OSError as e:
+            print('Failed saving the symbol index:', e)
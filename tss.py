@@ -1,23 +1,91 @@
-import sublime
+try:
+    import sublime
+except ImportError:
+    #Running outside of the editor, from check.py.
+    sublime = None
+
 import threading
 import subprocess
 import json
+import queue
 import time
 import os
-from .util import get_cursor_rowcol, norm_path
+from concurrent.futures import Future
+from .util import FilePolicies, get_cursor_rowcol, get_process_memory, get_view_version, norm_path
 
 tss_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tss', 'tss.js')
+libs_dir = norm_path(os.path.realpath(os.path.dirname(tss_file)))
 
-class TSSInterface():
+#Seconds a command may take before the process is considered hung
+#and restarted, batches get the sum of the deadlines of its commands.
+deadlines = {
+    'load': 60,
+    'files': 10,
+    'reload': 60,
+    'update': 10,
+    'showErrors': 60,
+    'completions': 5,
+    'type': 5,
+    'info': 5,
+    'check': 30
+}
 
-    def __init__(self):
-        self.files = None
+default_deadline = 30
+
+#Seconds between attempts at restarting a process, doubled after
+#every failed one up to the max.
+restart_delay = 1
+max_restart_delay = 60
+
+
+def get_deadline(command):
+    return deadlines.get(command.split(' ', 1)[0], default_deadline)
+
+
+def read_output(process, output):
+    for line in iter(process.stdout.readline, b''):
+        output.put(line)
+
+    #Signals that the process died.
+    output.put(None)
+
+
+class TSSWorker():
+
+    def __init__(self, interface):
+        self.interface = interface
+
+        #Paths whose buffers changed since they were last sent to this
+        #worker, they are sent right before its next command.
+        self.stale = set()
+
+        self.last_used = time.monotonic()
+        self.hibernated = False
+
+        #Set while the process is restarted in the background, a failed
+        #restart is tried again later and not by the next request.
+        self.restarting = False
+        self.restart_delay = 0
+
+        #Client side metrics, the number of requests answered and
+        #the time spent processing them.
+        self.requests = 0
+        self.processing_time = 0
+
+        #Files not type checked since the process was loaded, None until
+        #the files are known. Requests waiting for the lock are counted
+        #so the warm up gives way to them.
+        self.cold = None
+        self.waiting = 0
+        self._waiting_lock = threading.Lock()
 
         self._lock = threading.Lock()
         self._closed = False
 
 
-    def _connect(self, root_file):
+    def _spawn(self):
+        root_file = self.interface.root_file
+
         args = []
         kwargs = {}
 
@@ -31,50 +99,427 @@ class TSSInterface():
             kwargs['startupinfo'] = si
 
         self._process = subprocess.Popen(*args, **kwargs)
-        result = self._process.stdout.readline().decode('utf-8')
 
-        if result.lower() != '"loaded {0}, TSS listening.."\n'.format(root_file).lower():
+        #The output is read in a separate thread so every read can
+        #have a deadline.
+        self._output = queue.Queue()
+        reader = threading.Thread(target=read_output, args=(self._process, self._output))
+        reader.daemon = True
+        reader.start()
+
+        try:
+            result = self._output.get(timeout=deadlines['load'])
+        except queue.Empty:
+            result = None
+
+        if not result or result.decode('utf-8').lower() != '"loaded {0}, TSS listening.."\n'.format(root_file).lower():
+            self._process.kill()
             raise Exception('Invalid file ' + root_file)
 
-        self.files = [norm_path(f) for f in self._run('files')]
+        self.stale.clear()
+        self.cold = None
+
+
+    def start(self):
+        with self._lock:
+            try:
+                self._spawn()
+            except Exception as e:
+                #Tried again on the first request.
+                print(e)
+                self.hibernated = True
 
 
     def _close(self):
         with self._lock:
-            self._process.kill()
+            if not self.hibernated:
+                self._process.kill()
             self._closed = True
 
 
+    def hibernate(self):
+        with self._lock:
+            if self._closed or self.hibernated or self.restarting:
+                return
+
+            self._process.kill()
+            self.hibernated = True
+
+
+    def _wake(self):
+        self._spawn()
+        self.hibernated = False
+
+        buffers = list(self.interface.buffers.values())
+        if buffers and self._send_many(buffers) is None:
+            self.hibernated = True
+            raise Exception('Failed restoring the buffers of ' + self.interface.root_file)
+
+
+    def _schedule_restart(self):
+        #Called with the lock held.
+        self.restarting = True
+
+        timer = threading.Timer(self.restart_delay, self._restart)
+        timer.daemon = True
+        timer.start()
+
+
+    def _restart(self):
+        with self._lock:
+            if self._closed:
+                self.restarting = False
+                return
+
+            print('Restarting tss for', self.interface.root_file)
+
+            try:
+                self._wake()
+            except Exception as e:
+                #A buffer that hangs tss would hang every attempt, so
+                #they are spaced out while requests keep failing.
+                print('Failed restarting tss:', e)
+                if hasattr(self, '_process'):
+                    self._process.kill()
+
+                self.restart_delay = min(max(restart_delay, self.restart_delay * 2), max_restart_delay)
+                self._schedule_restart()
+                return
+
+            self.restart_delay = 0
+            self.restarting = False
+
+
+    def memory(self):
+        if self._closed or self.hibernated:
+            return 0
+
+        return get_process_memory(self._process.pid) or 0
+
+
     def _run(self, data):
-        data += '\n'
+        results = self._run_many([data])
+        if results is None:
+            return None
+
+        return results[0] if results else ""
+
+
+    def _run_many(self, commands, blocking=True):
+        #While the process is restarted every request fails right away,
+        #returning None instead of waiting for the lock. Non blocking
+        #requests fail too if the lock is taken.
+        deadline = sum([get_deadline(command) for command in commands])
+        deadline += len(self.stale) * deadlines['update']
         lock_timer = time.monotonic()
 
-        with self._lock:
+        if self.restarting:
+            return None
+
+        with self._waiting_lock:
+            self.waiting += 1
+
+        try:
+            if blocking:
+                acquired = self._lock.acquire(timeout=deadline)
+            else:
+                acquired = self._lock.acquire(False)
+        finally:
+            with self._waiting_lock:
+                self.waiting -= 1
+
+        if not acquired:
+            return None
+
+        try:
             if self._closed:
-                return ""
+                return []
+
+            #Background work (the warm up) doesn't count as a use.
+            if blocking:
+                self.last_used = time.monotonic()
+
+            if self.hibernated:
+                try:
+                    self._wake()
+                except Exception as e:
+                    print(e)
+                    self.restart_delay = restart_delay
+                    self._schedule_restart()
+                    return None
+
+            #Buffers changed since the last command are sent first, in
+            #the same batch, so the worker follows the edit stream.
+            buffers = self.interface.buffers
+            stale = self.stale.copy()
+            sync = dict([(path, buffers[path]) for path in stale if path in buffers])
 
             init_timer = time.monotonic()
-            print('>', data[:-1][:60], '...')
-            self._process.stdin.write(data.encode('utf-8'))
-            result = self._process.stdout.readline().decode('utf-8')
-            print('<', result[:-1][:60], '...')
+            results = self._send_many(list(sync.values()) + commands)
+
+            if results is None:
+                self._schedule_restart()
+                return None
+
+            #A path updated again while the command ran stays stale, as
+            #its new buffer was never sent.
+            for path in stale:
+                if buffers.get(path) is sync.get(path):
+                    self.stale.discard(path)
+
+            results = results[len(sync):]
+
+        finally:
+            self._lock.release()
 
         end_timer = time.monotonic()
+        self.requests += len(commands)
+        self.processing_time += end_timer - init_timer
+
         print('Took {0}ms in total({1}ms processing, {2}ms locked)'.format(
               str(int((end_timer - lock_timer) * 1000)),
               str(int((end_timer - init_timer) * 1000)),
               str(int((init_timer - lock_timer) * 1000))));
 
-        return json.loads(result)
+        return results
+
+
+    def _send_many(self, commands):
+        #All the commands are written before reading any result, so
+        #batches are sent in a single round trip with the lock held.
+        data = ''.join([command + '\n' for command in commands])
+
+        deadline = sum([get_deadline(command) for command in commands])
+        end_time = time.monotonic() + deadline
+
+        for command in commands:
+            print('>', command[:60], '...')
+
+        results = []
+
+        try:
+            self._process.stdin.write(data.encode('utf-8'))
+            self._process.stdin.flush()
+
+            for command in commands:
+                result = self._output.get(timeout=max(0, end_time - time.monotonic()))
+                if result is None:
+                    raise EOFError()
+
+                result = result.decode('utf-8')
+                print('<', result[:-1][:60], '...')
+                results.append(json.loads(result))
+
+        except (OSError, EOFError, queue.Empty):
+            print('tss for {0} is not responding'.format(self.interface.root_file))
+            self._process.kill()
+
+            return None
+
+        return results
+
+
+class TSSInterface():
+
+    def __init__(self, background=False, shards=1, policies=None):
+        self.files = None
+        self.root_file = None
+        self.policies = policies or FilePolicies()
+
+        #Version of every buffer as it was last sent to tss, used to
+        #skip updates when the content didn't change since then.
+        self.versions = {}
+
+        #Last update sent for every buffer since the files were read
+        #from disk, replayed when a hibernated or restarted process
+        #is brought back.
+        self.buffers = {}
+
+        #Held while reading views and storing their buffers and versions,
+        #so a late update never overwrites a newer one.
+        self._update_lock = threading.Lock()
+
+        #Set when reloaded while hibernated, the new list of files is
+        #read once the interface is used again.
+        self.reload_pending = False
+
+        #Latency sensitive commands (completions) go to the interactive
+        #worker, whole project checks to the background ones, each one
+        #checking a slice of the files in its own process when they are
+        #split in more than one shard. The interactive worker is the one
+        #checking the first shard unless background is set.
+        self.checkers = [TSSWorker(self) for shard in range(shards)]
+        self.interactive = TSSWorker(self) if background else self.checkers[0]
+
+        self.background = self.checkers[0]
+        self.workers = [self.interactive] + [w for w in self.checkers if w is not self.interactive]
+
+        self._closed = False
+
+
+    def _connect(self, root_file):
+        self.root_file = root_file
+
+        threads = [threading.Thread(target=worker.start) for worker in self.workers]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        files = self.interactive._run('files')
+        if files is None:
+            self._close()
+            raise Exception('Invalid file ' + root_file)
+
+        self.files = [norm_path(f) for f in files]
+
+
+    def _close(self):
+        for worker in self.workers:
+            if worker._closed or not hasattr(worker, '_process'):
+                worker._closed = True
+            else:
+                worker._close()
+
+        self._closed = True
+
+
+    @property
+    def hibernated(self):
+        return all([worker.hibernated for worker in self.workers])
+
+
+    @property
+    def last_used(self):
+        return max([worker.last_used for worker in self.workers])
+
+
+    def hibernate(self):
+        for worker in self.workers:
+            worker.hibernate()
+
+
+    def memory(self):
+        return sum([worker.memory() for worker in self.workers])
+
+
+    def get_metrics(self):
+        return {
+            'requests': sum([worker.requests for worker in self.workers]),
+            'processing_time': sum([worker.processing_time for worker in self.workers]),
+            'memory': self.memory()
+        }
+
+
+    def _run(self, data):
+        return self.interactive._run(data)
 
 
     def reload(self):
-        self._run('reload')
-        self.files = [norm_path(f) for f in self._run('files')]
+        #A worker that fails reloading is restarted, which reads the
+        #files from disk all the same. Hibernated workers read them
+        #when woken, so they are not woken just to reload.
+        threads = [threading.Thread(target=worker._run, args=('reload',))
+                   for worker in self.workers if not worker.hibernated]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        #tss reads every file from disk again on reload.
+        with self._update_lock:
+            self.versions.clear()
+            self.buffers.clear()
+
+        for worker in self.workers:
+            worker.cold = None
+
+        #The new files are returned rather than set, so the caller can
+        #set them along with its own bookkeeping. Read once the
+        #interface is used again if it's hibernated or unavailable.
+        files = None if self.hibernated else self.read_files()
+        if files is None:
+            self.reload_pending = True
+
+        return files
+
+
+    def read_files(self):
+        files = self._run('files')
+        if files is not None:
+            return [norm_path(f) for f in files]
+
+
+    def set_files(self, files):
+        self.files = files
+        self.reload_pending = False
+
+
+    def warm_up(self, priority_paths=()):
+        #Type checks one not yet checked file in the first worker that
+        #is free, the given paths first and the default libs last, so
+        #the first real requests find the program checked. Returns
+        #whether anything was checked.
+        for worker in self.workers:
+            if worker.cold is None:
+                worker.cold = set(self.get_warm_up_files(worker))
+
+            if not worker.cold or worker.hibernated or worker.restarting or worker.waiting:
+                continue
+
+            cold = worker.cold.copy()
+            paths = [p for p in priority_paths if p in cold]
+            paths += sorted(cold - set(paths), key=lambda p: p.startswith(libs_dir + '/'))
+
+            worker.cold.discard(paths[0])
+            if worker._run_many(['check ' + paths[0]], blocking=False) is None:
+                #Busy, the file is checked next time.
+                worker.cold.add(paths[0])
+                continue
+
+            return True
+
+        return False
+
+
+    def get_warm_up_files(self, worker):
+        #Checkers only warm up the slice of the files they check, the
+        #same one showErrors gives them.
+        files = self.get_checked_files()
+        if worker not in self.checkers:
+            return files
+
+        shard = self.checkers.index(worker)
+        shards = len(self.checkers)
+        return files[len(files) * shard // shards:len(files) * (shard + 1) // shards]
+
+
+    def get_checked_files(self):
+        #Read only files are never sent to tss again, so their errors
+        #can't change and aren't checked.
+        return [f for f in self.files or [] if not self.policies.get_for_disk(f).get('read_only')]
 
 
     def get_errors(self):
-        errors = self._run('showErrors')
+        #Only given the files to check if some are left out, the list
+        #of a whole project makes for a long command.
+        files = self.get_checked_files()
+        files = ' ' + json.dumps(files) if len(files) < len(self.files or []) else ''
+
+        if len(self.checkers) == 1:
+            errors = self.background._run('showErrors' + files)
+
+            #Every file was just checked.
+            if errors is not None:
+                self.background.cold = set()
+        else:
+            errors = self._get_sharded_errors(files)
+
+        if errors is None:
+            return None
+
         for error in errors:
             start = error['start']
             end = error['end']
@@ -96,26 +541,155 @@ class TSSInterface():
         return errors
 
 
-    def get_completions(self, view, rowcol=(None, None)):
+    def _get_sharded_errors(self, files=''):
+        shards = len(self.checkers)
+        results = [None] * shards
+
+        def check(shard):
+            results[shard] = self.checkers[shard]._run('showErrors {0} {1}{2}'.format(shard, shards, files))
+
+        threads = [threading.Thread(target=check, args=(shard,)) for shard in range(shards)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        if None in results:
+            return None
+
+        #The shards are contiguous slices of the files, so joining them
+        #in order gives the same errors as a single showErrors.
+        errors = []
+        for result in results:
+            errors.extend(result)
+
+        return errors
+
+
+    def get_completions(self, view, rowcol=(None, None), member=False):
         row, col = rowcol
         if not col:
             row, col = get_cursor_rowcol(view)
 
         file_name = norm_path(view.file_name())
-        result = self._run('completions false {0} {1} {2}'.format(row + 1, col + 1, file_name))
+        result = self.interactive._run('completions {0} {1} {2} {3}'.format(
+            'true' if member else 'false', row + 1, col + 1, file_name))
 
-        if result:
-            return [{'name': c['name'], 'type': c['type']} for c in result['entries']]
-        else:
+        #None while the tss is unavailable, so it's not taken as a
+        #position without completions.
+        if result is None:
+            return None
+
+        if not result:
             return []
 
+        return [{'name': c['name'], 'type': c['type']} for c in result['entries']]
+
+
+    def get_type(self, view, rowcol=(None, None)):
+        row, col = rowcol
+        if col is None:
+            row, col = get_cursor_rowcol(view)
 
-    def update(self, view):
-        content = view.substr(sublime.Region(0, view.size()))
-        lines = len(content.split('\n'))
         file_name = norm_path(view.file_name())
+        result = self.interactive._run('type {0} {1} {2}'.format(row + 1, col + 1, file_name))
+
+        if result is None:
+            return None
+
+        if type(result) is not dict or not result.get('type'):
+            return {}
+
+        return {
+            'symbol': result.get('fullSymbolName') or '',
+            'kind': result.get('kind') or '',
+            'type': result['type'],
+            'doc': result.get('docComment') or ''
+        }
+
+
+    def get_structure(self, paths, batch_size=20):
+        #Whole project indexing is throughput work, so it goes to the
+        #background worker, in small batches so the lock is given up in
+        #between when that is the interactive worker too.
+        results = []
+        for start in range(0, len(paths), batch_size):
+            batch = self.background._run_many(['structure ' + path for path in paths[start:start + batch_size]])
+            if batch is None:
+                break
+
+            results.extend(batch)
+
+        if not results and paths:
+            return None
+
+        structure = {}
+        for path, result in zip(paths, results):
+            if type(result) is not list:
+                continue
+
+            structure[path] = [{
+                'name': s['loc']['name'],
+                'kind': s['loc']['kind'],
+                'container': s['loc']['containerName'],
+                'row': s['min']['line'] - 1,
+                'col': s['min']['character'] - 1
+            } for s in result if s['loc']['name']]
+
+        return structure
+
+
+    def update(self, view):
+        self.update_views([view])
+
+
+    def update_views(self, views):
+        commands = {}
+        versions = {}
+
+        with self._update_lock:
+            for view in views:
+                file_name = norm_path(view.file_name())
+                version = get_view_version(view)
+                sent_version = self.versions.get(file_name)
+
+                if sent_version == version or file_name in versions:
+                    continue
+
+                #Never goes back to an older change of the same buffer.
+                if sent_version and sent_version[0] == version[0] and sent_version[1] > version[1]:
+                    continue
+
+                #Read only files are never sent again once tss has them, and
+                #files with check disabled skip the diagnostics tss runs on
+                #every update.
+                policy = self.policies.get(file_name, view.size())
+                if policy.get('read_only') and (file_name in (self.files or []) or file_name in self.buffers):
+                    continue
+
+                content = view.substr(sublime.Region(0, view.size()))
+                lines = len(content.split('\n'))
+
+                update = 'update' if policy.get('check', True) else 'update nocheck'
+                commands[file_name] = '{0} {1} {2}\n{3}'.format(update, lines, file_name, content)
+                versions[file_name] = version
 
-        self._run('update {0} {1}\n{2}'.format(lines, file_name, content))
+            if not commands:
+                return
+
+            self.buffers.update(commands)
+            for worker in self.workers:
+                worker.stale.update(commands.keys())
+
+            self.versions.update(versions)
+
+        #Only the interactive worker is updated right away, the background
+        #one gets the buffers with its next command so an update never waits
+        #for a running check. A hibernated worker is not restored just for an
+        #update, it gets every buffer once it is restored instead.
+        if not self.interactive.hibernated:
+            self.interactive._run_many([])
 
 
 class InterfaceCollection():
@@ -164,6 +738,17 @@ class InterfaceManager():
 
         self.active_paths_by_interface = {}
 
+        #Futures of the interfaces being created, by root path.
+        self.connecting_by_path = {}
+
+        #Views whose files lost every interface, added again as soon
+        #as the lock is released.
+        self.orphaned_views = []
+
+        #Optional RootIndex, used to start a file from the root of its
+        #project instead of spawning a tss just for it.
+        self.root_index = None
+
         #Events triggered on some actions.
         self.on_view_added = None
         self.on_view_removed = None
@@ -172,6 +757,23 @@ class InterfaceManager():
         self.on_file_removed = None
         self.on_file_rename = None
 
+        #Interfaces idle for longer than hibernate_after seconds, or the
+        #least recently used ones while the processes take more than
+        #memory_budget bytes, are hibernated. None disables each check.
+        self.hibernate_after = None
+        self.memory_budget = None
+
+        #Whether every interface gets a second tss process for whole
+        #project checks, so they never delay completions.
+        self.background_worker = False
+
+        #Number of processes the whole project checks of every
+        #interface are split in.
+        self.check_shards = 1
+
+        #Policies for big or generated files, by path pattern and size.
+        self.file_policies = FilePolicies()
+
         self._lock = threading.RLock()
 
 
@@ -210,23 +812,99 @@ class InterfaceManager():
             if not len(f.interfaces):
                 views = f.views.copy()
                 for view in views:
-                    self.remove(view)
+                    self._remove(view)
 
                 del self.file_by_path[path]
 
                 if self.on_file_removed:
                     self.on_file_removed(f)
 
-                for view in views:
-                    self.add(view)
+                #Added again once the lock is released, so a new tss is
+                #never spawned while holding it.
+                self.orphaned_views.extend(views)
+
+
+    def add_orphaned_views(self):
+        with self._lock:
+            views = self.orphaned_views
+            self.orphaned_views = []
+
+        for view in views:
+            try:
+                self.add(view)
+            except Exception as e:
+                print('Failed adding {0} again: {1}'.format(view.file_name(), e))
 
 
     def create_interface(self, root_path):
-        interface = TSSInterface()
-        interface._connect(root_path)
+        #Spawning a tss takes a while, so it is done outside of the lock
+        #and concurrent calls for the same root share the same spawn. It
+        #must never be called with the lock held.
+        with self._lock:
+            if root_path in self.file_by_path:
+                return
+
+            future = self.connecting_by_path.get(root_path)
+            wait = future is not None
+
+            if not wait:
+                future = self.connecting_by_path[root_path] = Future()
+
+        if wait:
+            future.result()
+            return
+
+        try:
+            interface = TSSInterface(background=self.background_worker, shards=self.check_shards,
+                                     policies=self.file_policies)
+            interface._connect(root_path)
+
+            with self._lock:
+                self.active_paths_by_interface[interface] = set()
+                self.add_interface(interface, interface.files)
+
+        except Exception as e:
+            self._finish_connecting(root_path, future, exception=e)
+            raise
+
+        self._finish_connecting(root_path, future)
+        self.add_orphaned_views()
 
-        self.active_paths_by_interface[interface] = set()
-        self.add_interface(interface, interface.files)
+
+    def create_root_interface(self, view, path):
+        window = view.window()
+        folders = window.folders() if window else []
+        root_path = self.root_index.get_root(path, folders)
+
+        if root_path == path:
+            return
+
+        with self._lock:
+            f = self.file_by_path.get(root_path)
+
+        try:
+            #The root is already loaded, but it didn't reference the file
+            #at the time, so it is reloaded to pick the file up.
+            if f:
+                self.reload(InterfaceCollection(f.interfaces))
+            else:
+                self.create_interface(root_path)
+
+        except Exception as e:
+            print('Failed starting {0} from {1}: {2}'.format(path, root_path, e))
+
+
+    def _finish_connecting(self, root_path, future, exception=None):
+        with self._lock:
+            if self.connecting_by_path.get(root_path) is not future:
+                return
+
+            del self.connecting_by_path[root_path]
+
+        if exception:
+            future.set_exception(exception)
+        else:
+            future.set_result(None)
 
 
     def close_interface(self, interface):
@@ -250,18 +928,26 @@ class InterfaceManager():
         if view.id() in self.file_by_view:
             raise Exception('Tried adding already handled view')
 
-        with self._lock:
-            path = norm_path(view.file_name())
+        path = norm_path(view.file_name())
 
-            if path not in self.file_by_path:
-                self.create_interface(path)
+        if self.root_index and path not in self.file_by_path:
+            self.create_root_interface(view, path)
 
-            f = self.file_by_path[path]
-            f.views.append(view)
-            self.file_by_view[view.id()] = f
+        #Created again if the interface was closed in the meantime.
+        f = None
+        while not f:
+            self.create_interface(path)
+
+            with self._lock:
+                f = self.file_by_path.get(path)
+                if not f:
+                    continue
 
-            for interface in f.interfaces:
-                self.active_paths_by_interface[interface].add(path)
+                f.views.append(view)
+                self.file_by_view[view.id()] = f
+
+                for interface in f.interfaces:
+                    self.active_paths_by_interface[interface].add(path)
 
         if self.on_view_added:
             self.on_view_added(view, f, InterfaceCollection(f.interfaces))
@@ -270,6 +956,11 @@ class InterfaceManager():
 
 
     def remove(self, view):
+        self._remove(view)
+        self.add_orphaned_views()
+
+
+    def _remove(self, view):
         f = self.file_by_view[view.id()]
         if self.on_view_removed:
             self.on_view_removed(view, f)
@@ -321,23 +1012,78 @@ class InterfaceManager():
         if path != f.path:
             return self.rename(f)
 
+        #Interfaces reloaded while hibernated get their files now that
+        #they are used again, reading them wakes the tss so it's done
+        #outside of the lock.
+        for interface in f.interfaces.copy():
+            if interface.reload_pending and not interface._closed:
+                self.set_files(interface, interface.read_files())
+                self.add_orphaned_views()
+
         return InterfaceCollection(f.interfaces)
 
 
     def reload(self, interface_collection):
+        #tss reloads outside of the lock, as it takes a while, and only
+        #the new files are set under it.
         for interface in interface_collection.interfaces:
+            if not interface._closed:
+                self.set_files(interface, interface.reload())
+
+        self.add_orphaned_views()
+
+
+    def set_files(self, interface, files):
+        #The files of the interface and the registry are changed
+        #together, so concurrent adds never see them half updated.
+        if files is None:
+            return
+
+        with self._lock:
             if interface._closed:
-                continue
+                return
 
             old_paths = set(interface.files)
-            interface.reload()
-            new_paths = set(interface.files)
+            interface.set_files(files)
+            self.update_paths(interface, old_paths)
+
+
+    def update_paths(self, interface, old_paths):
+        new_paths = set(interface.files)
 
-            added_paths = new_paths - old_paths
-            removed_paths = old_paths - new_paths
+        added_paths = new_paths - old_paths
+        removed_paths = old_paths - new_paths
+
+        self.remove_interface(interface, removed_paths)
+        self.add_interface(interface, added_paths)
+
+
+    def hibernate_idle(self):
+        with self._lock:
+            interfaces = [i for i in self.active_paths_by_interface if not i.hibernated]
 
-            self.remove_interface(interface, removed_paths)
-            self.add_interface(interface, added_paths)
+        #The most recently used interface is never hibernated, otherwise
+        #a single process over the budget would be restarted on every use.
+        interfaces.sort(key=lambda interface: interface.last_used)
+        candidates = interfaces[:-1]
+
+        if self.hibernate_after is not None:
+            now = time.monotonic()
+            for interface in candidates.copy():
+                if now - interface.last_used > self.hibernate_after:
+                    interface.hibernate()
+                    candidates.remove(interface)
+
+        if self.memory_budget is not None:
+            memory_by_interface = dict([(i, i.memory()) for i in interfaces if not i.hibernated])
+            memory = sum(memory_by_interface.values())
+
+            for interface in candidates:
+                if memory <= self.memory_budget:
+                    break
+
+                interface.hibernate()
+                memory -= memory_by_interface[interface]
 
 
     def close_all(self):
@@ -347,8 +1093,13 @@ class InterfaceManager():
                 if view not in all_views:
                     all_views.append(view)
 
-        for view in all_views:
-            self.remove(view)
+        with self._lock:
+            for view in all_views:
+                #Views of closed interfaces were already removed.
+                if view.id() in self.file_by_view:
+                    self._remove(view)
+
+            self.orphaned_views = []
 
 
     def get_active_paths(self, interface):
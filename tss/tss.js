@@ -68475,7 +68475,7 @@ var Harness;
         };
 
         // collect Diagnostics
-        TypeScriptLS.prototype.getErrors = function () {
+        TypeScriptLS.prototype.getErrors = function (files) {
             var _this = this;
             var addPhase = function (phase) {
                 return function (d) {
@@ -68485,7 +68485,7 @@ var Harness;
             };
             var errors = [];
             this.ls.refresh(false);
-            this.fileNameToScript.getAllKeys().forEach(function (file) {
+            (files || this.fileNameToScript.getAllKeys()).forEach(function (file) {
                 var syntactic = _this.ls.languageService.getSyntacticDiagnostics(file);
                 var semantic = _this.ls.languageService.getSemanticDiagnostics(file);
 
@@ -69037,11 +69037,21 @@ var TSS = (function () {
                     } else {
                         _this.ioHost.printLine('"cannot update line range in new file"');
                     }
-                } else if (m = cmd.match(/^showErrors$/)) {
-                    info = [].concat(_this.resolutionResult.diagnostics.map(function (d) {
+                } else if (m = cmd.match(/^showErrors( (\d+) (\d+))?( (\[.*\]))?$/)) {
+                    // "showErrors i n" only checks the i-th of n contiguous slices of
+                    // the files, so the slices in order give the same output as a
+                    // plain showErrors. A JSON list of files checks only those.
+                    var shard = m[1] ? parseInt(m[2]) : 0;
+                    var shards = m[1] ? parseInt(m[3]) : 1;
+                    var files = m[4] ? JSON.parse(m[5]).map(function (f) {
+                        return _this.resolveRelativePath(f);
+                    }) : _this.typescriptLS.fileNameToScript.getAllKeys();
+                    files = files.slice(Math.floor(files.length * shard / shards), Math.floor(files.length * (shard + 1) / shards));
+
+                    info = [].concat(shard === 0 ? _this.resolutionResult.diagnostics.map(function (d) {
                         d["phase"] = "Resolution";
                         return d;
-                    }), _this.typescriptLS.getErrors()).map(function (d) {
+                    }) : [], _this.typescriptLS.getErrors(files)).map(function (d) {
                         var file = d.fileName();
                         var lc = _this.typescriptLS.positionToLineCol(file, d.start());
                         var len = _this.typescriptLS.getScriptInfo(file).content.length;
@@ -69060,6 +69070,13 @@ var TSS = (function () {
                     });
 
                     _this.ioHost.printLine(JSON.stringify(info).trim());
+                } else if (m = cmd.match(/^check (.*)$/)) {
+                    // type checks a single file ahead of time, answering with its error count
+                    file = _this.resolveRelativePath(m[1]);
+
+                    info = _this.typescriptLS.getErrors([file]).length;
+
+                    _this.ioHost.printLine(JSON.stringify(info));
                 } else if (m = cmd.match(/^files$/)) {
                     info = _this.typescriptLS.getScriptFileNames();
 
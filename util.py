@@ -1,4 +1,8 @@
 from os import path
+from collections import OrderedDict
+from fnmatch import fnmatch
+import os
+import subprocess
 import threading
 
 def norm_path(p):
@@ -7,6 +11,9 @@ def norm_path(p):
 def get_cursor_rowcol(view):
     return view.rowcol(view.sel()[0].a)
 
+def get_view_version(view):
+    return (view.buffer_id(), view.change_count())
+
 def is_typescript(view):
     return view.file_name() and view.settings().get('syntax').lower().endswith('typescript.tmlanguage')
 
@@ -18,6 +25,87 @@ def typescript_view(f):
     return call_f
 
 
+class LRUCache():
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+
+            self._items.move_to_end(key)
+            return self._items[key]
+
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class FilePolicies():
+
+    def __init__(self, policies=()):
+        self.policies = list(policies)
+
+        #Size in characters of the files in disk, by path, along with
+        #the mtime it was measured at.
+        self._sizes = {}
+
+
+    def get(self, file_path, size=None):
+        #Every policy matching the path pattern and size applies, the
+        #later ones overriding the earlier ones.
+        policy = {}
+        for p in self.policies:
+            if 'pattern' in p and not fnmatch(file_path, p['pattern']):
+                continue
+
+            if 'min_size' in p and (size is None or size < p['min_size']):
+                continue
+
+            policy.update(p)
+
+        return policy
+
+
+    def get_for_disk(self, file_path):
+        #Sizes are in characters, as view.size(), so the file has to be
+        #read, which is only done if a policy needs it and it changed.
+        if not any(['min_size' in p for p in self.policies]):
+            return self.get(file_path)
+
+        try:
+            mtime = path.getmtime(file_path)
+        except OSError:
+            return self.get(file_path)
+
+        cached = self._sizes.get(file_path)
+        if not cached or cached[0] != mtime:
+            try:
+                with open(file_path, encoding='utf-8') as f:
+                    size = len(f.read())
+            except (OSError, UnicodeDecodeError):
+                size = None
+
+            cached = self._sizes[file_path] = (mtime, size)
+
+        return self.get(file_path, cached[1])
+
+
 debounced_timers = {}
 def debounce(fn, delay, tag=None, *args):
     tag = tag if tag else fn
@@ -34,3 +122,25 @@ def debounce(fn, delay, tag=None, *args):
 def remove_debounce(tag):
     if tag in debounced_timers:
         debounced_timers[tag].cancel()
+
+
+def get_process_memory(pid):
+    #Resident memory of a process in bytes, None if it can't be read.
+    try:
+        if path.exists('/proc/{0}/statm'.format(pid)):
+            with open('/proc/{0}/statm'.format(pid)) as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+        if os.name == 'nt':
+            si = subprocess.STARTUPINFO()
+            si.dwFlags = subprocess.STARTF_USESHOWWINDOW
+            output = subprocess.check_output(['tasklist', '/fi', 'PID eq {0}'.format(pid), '/fo', 'csv', '/nh'],
+                                             startupinfo=si).decode('utf-8', 'replace')
+            memory = output.strip().split('","')[-1]
+            return int(''.join(c for c in memory if c.isdigit())) * 1024
+
+        output = subprocess.check_output(['ps', '-o', 'rss=', '-p', str(pid)])
+        return int(output.strip()) * 1024
+
+    except (OSError, ValueError, IndexError, subprocess.CalledProcessError):
+        return None
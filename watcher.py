@@ -68,6 +68,7 @@ class ModuleWatcher():
         self.interfaces_by_path = {}
 
         self.on_module_change = None
+        self.on_files_created = None
 
 
     def add_paths(self, interface, paths):
@@ -141,6 +142,9 @@ class ModuleWatcher():
 
 
     def change_listener(self, changes):
+        if self.on_files_created:
+            self.on_files_created(changes)
+
         for path in changes:
             for interface in self.interfaces_by_path.get(path.split('.')[0], []):
                 if self.on_module_change: